@@ -5,6 +5,13 @@ It exposes the WSGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/1.9/howto/deployment/wsgi/
+
+If DIV_TRACKER_PRELOAD=1 is set in the environment, the dividend data is
+loaded once when this module is imported instead of on every request. Use
+it together with your server's preload option (e.g. gunicorn --preload) so
+that it's parsed only once, in the master, and workers serve their first
+request without parsing it. Each worker re-reads the data file on its next
+request after it changes.
 """
 
 import os
@@ -14,3 +21,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "div_tracker.settings")
 
 application = get_wsgi_application()
+
+if os.environ.get("DIV_TRACKER_PRELOAD") == "1":
+    from main import divs
+
+    divs.preloadDivEvents()
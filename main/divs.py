@@ -6,6 +6,14 @@ from decimal import Decimal
 import os
 import os.path
 
+# dividend events loaded by preloadDivEvents(), returned by getDivEvents()
+# instead of re-reading the data file on every call. None if not preloaded.
+_snapshot = None
+
+# (filename, modification time, size) of the data file _snapshot was read
+# from; a different value means the file has changed since
+_snapshotStat = None
+
 class Object(object):
     def __init__(self, **kwargs):
         self.__dict__.update(kwargs)
@@ -91,29 +99,73 @@ def nominalAmountFunc(ev):
 def perShareAmountFunc(ev):
     return Decimal("%.2f" % (float(ev.amount) * 100.0 / ev.shares))
 
-def getDivEvents():
-    """ Get all dividend events, sorted by date. """
+def findDataFile():
+    """ Return filename of the data file to use. """
 
     filesToTry = [
         "%s/info/investing/divs.csv" % os.environ["HOME"],
         "%s/sample.csv" % os.path.dirname(__file__),
         ]
 
-    events = None
-
     for filename in filesToTry:
         if os.path.isfile(filename):
-            events = readCsvFile(filename)
+            return filename
+
+    raise Exception("No data files found, tried %s" % filesToTry)
 
-            break
+def statDataFile(filename):
+    st = os.stat(filename)
 
-    if events is None:
-        raise Exception("No data files found, tried %s" % filesToTry)
+    return (filename, st.st_mtime, st.st_size)
 
-    eventsByDate = sorted(events, dateCmp)
+def readDivEvents(filename = None):
+    """ Read all dividend events from the data file, sorted by date. """
+
+    if filename is None:
+        filename = findDataFile()
+
+    eventsByDate = sorted(readCsvFile(filename), dateCmp)
 
     return eventsByDate
 
+def loadSnapshot():
+    global _snapshot, _snapshotStat
+
+    filename = findDataFile()
+
+    # stat before reading, so that a change made while reading is noticed
+    # on the next call
+    _snapshotStat = statDataFile(filename)
+    _snapshot = readDivEvents(filename)
+
+def getDivEvents():
+    """ Get all dividend events, sorted by date. The returned list must not
+    be modified, as it may be the snapshot shared by all requests. """
+
+    if _snapshot is None:
+        return readDivEvents()
+
+    if statDataFile(findDataFile()) != _snapshotStat:
+        loadSnapshot()
+
+    return _snapshot
+
+def preloadDivEvents():
+    """ Read the dividend events once and make getDivEvents() return that
+    snapshot from now on, re-reading the data file only when its
+    modification time or size changes.
+
+    Meant to be called in the master process of a pre-fork server, before
+    the workers are forked, so that the data file is parsed only once and
+    workers start out with it already loaded. Each worker still ends up
+    with its own copy of most of the snapshot's memory, as reference count
+    updates write to the pages it's on. Each worker notices changes to the
+    data file by itself, including ones forked after the change. """
+
+    loadSnapshot()
+
+    return _snapshot
+
 def getLastDivEventsByCompany(events):
     """Given input of dividend events sorted by date, return a dict where key
     is company name and value is last date that company has paid a
@@ -0,0 +1,81 @@
+import itertools
+
+import views
+
+def filterChoices(allEvents):
+    """ Return list of (filter name, list of possible values) tuples for all
+    filters understood by views.applyRequestFilters. None means the filter is
+    not set. """
+
+    def values(attrName):
+        return [None] + sorted(set(getattr(ev, attrName) for ev in allEvents))
+
+    return [
+        ("company", values("company")),
+        ("person", values("person")),
+        ("broker", values("broker")),
+        ("accountType",
+         [None, views.ACCOUNT_TYPE_NORMAL, views.ACCOUNT_TYPE_ISA]),
+        ("isProjected", [None, "0", "1"]),
+        ]
+
+def displayChoices():
+    """ Like filterChoices, but for the display options of the home view. """
+
+    return [
+        ("bucketH", [views.BUCKET_H_YEAR, views.BUCKET_H_TAX_YEAR]),
+        ("perShare", [None, "1"]),
+        ("cellContent", [None, views.CELL_CONTENT_DETAILS]),
+        ]
+
+def productOf(choices):
+    """ Yield a params dict for every combination of the given choices,
+    leaving out unset (None) values. """
+
+    names = [name for (name, vals) in choices]
+
+    for combo in itertools.product(*[vals for (name, vals) in choices]):
+        yield dict((name, val) for (name, val) in zip(names, combo)
+                   if val is not None)
+
+def drillDowns(events):
+    """ Yield params for every divEvents drill-down linked to from the home
+    tables, starting with the one without any drill-down params. """
+
+    years = sorted(set("%d" % ev.date.year for ev in events))
+    taxYears = sorted(set("%d" % views.taxYearOfDate(ev.date) for ev in events))
+
+    for params in productOf([
+            ("year", [None] + years),
+            ("month", [None] + views.MONTHS),
+            ]):
+        yield params
+
+    for params in productOf([
+            ("taxYear", [None] + taxYears),
+            ("taxYearMonth", [None] + views.TAX_YEAR_MONTHS),
+            ]):
+        # the one without params was already yielded above
+        if params:
+            yield params
+
+def drillDown(events, params):
+    """ Return those of events matching drill-down params as yielded by
+    drillDowns, the same way views.divEvents filters them. """
+
+    if "year" in params:
+        events = [ev for ev in events if ev.date.year == int(params["year"])]
+
+    if "month" in params:
+        events = [ev for ev in events
+                  if views.MONTHS[ev.date.month - 1] == params["month"]]
+
+    if "taxYear" in params:
+        events = [ev for ev in events
+                  if views.taxYearOfDate(ev.date) == int(params["taxYear"])]
+
+    if "taxYearMonth" in params:
+        events = [ev for ev in events
+                  if views.taxYearMonthOf(ev.date) == params["taxYearMonth"]]
+
+    return events
@@ -0,0 +1,238 @@
+import math
+from multiprocessing.pool import ThreadPool
+import random
+import threading
+import time
+import urllib
+import urllib2
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+
+from main import divs
+from main.facets import displayChoices, drillDowns, filterChoices
+
+# request kind -> (URL name, whether it's a CSV export)
+KINDS = {
+    "home": ("main:home", False),
+    "home-csv": ("main:home", True),
+    "div-events": ("main:div-events", False),
+    "div-events-csv": ("main:div-events", True),
+    }
+
+DEFAULT_MIX = "home=4,home-csv=1,div-events=4,div-events-csv=1"
+
+def parseMix(mix):
+    """ Parse a "kind=weight,..." string into a list of (kind, weight)
+    tuples. """
+
+    ret = []
+
+    for item in mix.split(","):
+        kind, sep, weight = item.partition("=")
+
+        if (kind not in KINDS) or not sep or not weight.isdigit():
+            raise CommandError("Invalid mix item '%s', expected one of %s "
+                               "followed by =weight" % (item, sorted(KINDS)))
+
+        ret.append((kind, int(weight)))
+
+    if not sum(weight for (kind, weight) in ret):
+        raise CommandError("At least one mix weight must be non-zero")
+
+    return ret
+
+def randomFilters(rnd, choices):
+    """ Return params dict setting each filter to a random value half of the
+    time, so that queries range from unfiltered to very narrow. """
+
+    params = {}
+
+    for name, vals in choices:
+        vals = [val for val in vals if val is not None]
+
+        if vals and (rnd.random() < 0.5):
+            params[name] = rnd.choice(vals)
+
+    return params
+
+def makeQueries(allEvents, mix, count, seed):
+    """ Return list of count (kind, URL path, params) tuples, with kinds
+    drawn according to mix and params from the values actually present in
+    allEvents. """
+
+    rnd = random.Random(seed)
+
+    filters = filterChoices(allEvents)
+    drills = list(drillDowns(allEvents))
+
+    kinds = []
+    for kind, weight in mix:
+        kinds.extend([kind] * weight)
+
+    ret = []
+
+    for i in range(count):
+        kind = rnd.choice(kinds)
+        urlName, isCsv = KINDS[kind]
+
+        params = randomFilters(rnd, filters)
+
+        if urlName == "main:home":
+            for name, vals in displayChoices():
+                val = rnd.choice(vals)
+
+                if val is not None:
+                    params[name] = val
+        else:
+            params.update(rnd.choice(drills))
+
+        if isCsv:
+            params["csv"] = "1"
+
+        ret.append((kind, reverse(urlName), params))
+
+    return ret
+
+def percentile(sortedVals, pct):
+    """ Return the pct'th percentile of a non-empty sorted list, using the
+    nearest-rank method. """
+
+    rank = int(math.ceil(pct / 100.0 * len(sortedVals)))
+
+    return sortedVals[min(max(rank, 1), len(sortedVals)) - 1]
+
+class Command(BaseCommand):
+    help = ("Send a mix of concurrent requests for the views, with queries "
+            "drawn from the loaded dividend data, and report latency "
+            "percentiles per request kind and the total throughput.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests", type = int, default = 1000,
+            help = "Total number of requests (default: %(default)s)")
+        parser.add_argument(
+            "--concurrency", type = int, default = 8,
+            help = "Number of concurrent client threads (default: %(default)s)")
+        parser.add_argument(
+            "--mix", default = DEFAULT_MIX,
+            help = "Relative weights of request kinds (default: %(default)s)")
+        parser.add_argument(
+            "--seed", type = int, default = 0,
+            help = "Random seed for generating queries (default: %(default)s)")
+        parser.add_argument(
+            "--url", default = None,
+            help = "Base URL of a running server to test, e.g. "
+            "http://127.0.0.1:8000; by default requests are sent in-process "
+            "through the Django test client")
+        parser.add_argument(
+            "--preload", action = "store_true", default = False,
+            help = "Preload the dividend data before sending in-process "
+            "requests, like DIV_TRACKER_PRELOAD=1 does for a WSGI server, "
+            "instead of every request parsing the data file")
+
+    def handle(self, *args, **options):
+        if (options["requests"] < 1) or (options["concurrency"] < 1):
+            raise CommandError("--requests and --concurrency must be positive")
+
+        if options["preload"] and options["url"]:
+            raise CommandError("--preload only applies to in-process requests; "
+                               "preload the server given with --url instead")
+
+        if options["preload"]:
+            divs.preloadDivEvents()
+
+        queries = makeQueries(
+            divs.getDivEvents(), parseMix(options["mix"]),
+            options["requests"], options["seed"])
+
+        baseUrl = options["url"]
+        local = threading.local()
+
+        def run(query):
+            kind, path, params = query
+
+            start = time.time()
+
+            # None if the request succeeded, otherwise description of why not
+            error = None
+
+            try:
+                if baseUrl:
+                    resp = urllib2.urlopen("%s%s?%s" % (
+                        baseUrl.rstrip("/"), path, urllib.urlencode(params)))
+                    resp.read()
+                    status = resp.getcode()
+                else:
+                    if not hasattr(local, "client"):
+                        local.client = Client()
+
+                    status = local.client.get(path, params).status_code
+
+                if status != 200:
+                    error = "HTTP %d" % status
+            except Exception as e:
+                error = "%s: %s" % (type(e).__name__, e)
+
+            return (kind, time.time() - start, error)
+
+        pool = ThreadPool(options["concurrency"])
+
+        start = time.time()
+
+        try:
+            results = pool.map(run, queries, chunksize = 1)
+        finally:
+            pool.close()
+            pool.join()
+
+        elapsed = time.time() - start
+
+        # key = kind, value = list of latencies in seconds
+        latencies = {}
+
+        # key = kind, value = number of failed requests
+        errors = {}
+
+        # key = kind, value = error of its first failed request
+        firstErrors = {}
+
+        for kind, seconds, error in results:
+            latencies.setdefault(kind, []).append(seconds)
+
+            if error is not None:
+                errors[kind] = errors.get(kind, 0) + 1
+                firstErrors.setdefault(kind, error)
+
+        fmt = "%-16s %8s %7s %9s %9s %9s %9s"
+
+        self.stdout.write(fmt % (
+            "kind", "requests", "errors", "p50 ms", "p95 ms", "p99 ms", "req/s"))
+
+        for kind in sorted(latencies.keys()) + ["total"]:
+            if kind == "total":
+                vals = sorted(seconds for (k, seconds, error) in results)
+                errorCount = sum(errors.values())
+
+                # the kinds' requests are interleaved over the whole run, so
+                # only the total has a meaningful throughput
+                throughput = "%.1f" % (len(vals) / elapsed)
+            else:
+                vals = sorted(latencies[kind])
+                errorCount = errors.get(kind, 0)
+                throughput = ""
+
+            self.stdout.write(fmt % (
+                kind, len(vals), errorCount,
+                "%.1f" % (percentile(vals, 50) * 1000),
+                "%.1f" % (percentile(vals, 95) * 1000),
+                "%.1f" % (percentile(vals, 99) * 1000),
+                throughput))
+
+        self.stdout.write("%d requests in %.2f s with %d threads" % (
+            len(results), elapsed, options["concurrency"]))
+
+        for kind in sorted(firstErrors.keys()):
+            self.stdout.write("First error for %s: %s" % (
+                kind, firstErrors[kind]))
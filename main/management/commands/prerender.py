@@ -0,0 +1,388 @@
+import datetime
+import hashlib
+import json
+import multiprocessing
+import os
+import os.path
+import re
+import shutil
+import urllib
+import urlparse
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+
+from main import divs
+from main import views
+from main.facets import (
+    displayChoices, drillDown, drillDowns, filterChoices, productOf)
+
+MANIFEST_NAME = ".prerender-manifest.json"
+
+# URL path of each prerendered view -> directory its pages are written to
+PAGE_DIRS = {
+    "/": "home",
+    "/div-events/": "div-events",
+    "/ttm/": "ttm",
+    }
+
+HREF_RE = re.compile(r'href="([^"]*)"')
+
+# static paths of all pages rendered in this run, set before the worker
+# processes are forked; links to anything else point to the shared pages for
+# view states without any events
+_pagePaths = set()
+
+EMPTY_PAGE_TEXT = "<p>No dividends match the selected filters.</p>"
+
+def staticPathFor(path, query):
+    """ Return the path, relative to the output directory, of the static
+    file holding the page at the given URL path and query string. Query
+    parameters are sorted so that every link to the same view state maps to
+    the same file regardless of parameter order. """
+
+    pairs = sorted(urlparse.parse_qsl(query))
+
+    if ("csv", "1") in pairs:
+        ext = "csv"
+    else:
+        ext = "html"
+
+    if not pairs:
+        if path == "/":
+            return "index.html"
+
+        return "%s/index.%s" % (PAGE_DIRS[path], ext)
+
+    name = hashlib.sha1(urllib.urlencode(pairs)).hexdigest()[:16]
+
+    return "%s/%s.%s" % (PAGE_DIRS[path], name, ext)
+
+def emptyPathFor(path, query):
+    """ Return the path of the static file shared by all view states without
+    events of the page at the given URL path and query string. The HTML
+    pages don't depend on the view state at all; the home CSV export only
+    depends on the grouping, which decides its rows. """
+
+    params = dict(urlparse.parse_qsl(query))
+
+    if params.get("csv") != "1":
+        return "%s/empty.html" % PAGE_DIRS[path]
+
+    if path == "/":
+        return "%s/empty-%s.csv" % (
+            PAGE_DIRS[path], params.get("bucketH", views.BUCKET_H_YEAR))
+
+    return "%s/empty.csv" % PAGE_DIRS[path]
+
+def emptyPages():
+    """ Return dict where key is a static path as returned by emptyPathFor
+    and value is the content of that file. """
+
+    req = RequestFactory().get("/")
+
+    html = "\n\n".join([
+        views.getHTMLHeader(),
+        "<div id=sidebar>\n<a href=\"/index.html\">Home</a>\n</div>",
+        "<div id=main>\n%s\n</div>" % EMPTY_PAGE_TEXT,
+        views.getHTMLFooter()])
+
+    pages = {
+        "home/empty.html": html,
+        "div-events/empty.html": html,
+        "div-events/empty.csv":
+            views.renderCsv([divs.DividendEvent.header()]).content,
+        }
+
+    for bucketH, func in [(views.BUCKET_H_YEAR, views.byYear),
+                          (views.BUCKET_H_TAX_YEAR, views.byTaxYear)]:
+        data = func(req, [], {}, divs.nominalAmountFunc)[0]
+        pages["home/empty-%s.csv" % bucketH] = views.renderCsv(data).content
+
+    return pages
+
+def rewriteLinks(html, pagePaths):
+    """ Rewrite all links to prerendered views in html to point to the
+    corresponding static files. Links to view states whose static path is
+    not in pagePaths point to the shared page for states without events. """
+
+    def repl(m):
+        parts = urlparse.urlsplit(m.group(1))
+
+        if parts.path not in PAGE_DIRS:
+            return m.group(0)
+
+        relPath = staticPathFor(parts.path, parts.query)
+
+        if relPath not in pagePaths:
+            relPath = emptyPathFor(parts.path, parts.query)
+
+        return "href=\"/%s\"" % relPath
+
+    return HREF_RE.sub(repl, html)
+
+def eventsDigest(events):
+    return hashlib.sha1(repr([ev.asList() for ev in events])).hexdigest()
+
+def filterCombos(events, choices, params = None):
+    """ Yield (params, filtered events) for every combination of the filter
+    choices, except ones extending a combination that already leaves no
+    events, as those would leave none either. """
+
+    if params is None:
+        params = {}
+
+    if not choices:
+        yield (params, events)
+
+        return
+
+    name, vals = choices[0]
+
+    for val in vals:
+        if val is None:
+            subParams, subEvents = params, events
+        else:
+            subParams = dict(params)
+            subParams[name] = val
+            subEvents = views.filterBy(events, name, [val])
+
+        if subEvents:
+            for combo in filterCombos(subEvents, choices[1:], subParams):
+                yield combo
+        else:
+            yield (subParams, subEvents)
+
+def enumeratePages(allEvents):
+    """ Yield (static path, URL name, params, fingerprint) for every view
+    state reachable by following links from the home page. The fingerprint
+    changes whenever the events that the page is rendered from change.
+
+    View states without any events are left out; rewriteLinks points links
+    to them to the pages from emptyPages instead. """
+
+    def page(urlName, params, events, digest):
+        if not events:
+            return None
+
+        path = reverse(urlName)
+
+        return (staticPathFor(path, urllib.urlencode(params)),
+                urlName, params, digest)
+
+    today = datetime.date.today()
+    lastDivs = divs.getLastDivEventsByCompany(allEvents)
+
+    # the home sidebar lists all persons, brokers and companies, the latter
+    # split by whether they're still active
+    sidebarDigest = hashlib.sha1(repr([
+        sorted(set(ev.person for ev in allEvents)),
+        sorted(set(ev.broker for ev in allEvents)),
+        sorted((c, (today - d).days < 365) for (c, d) in lastDivs.items()),
+        ])).hexdigest()
+
+    # the trailing twelve month view is only linked to without filters, and
+    # defaults to ending today
+    ttmDigest = eventsDigest(allEvents) + today.isoformat()
+
+    ttmParams = [{}]
+
+    for dimension in [views.TTM_DIMENSION_COMPANY, views.TTM_DIMENSION_PERSON]:
+        ttmParams.append({"dimension": dimension})
+        ttmParams.append({"dimension": dimension, "csv": "1"})
+
+    for params in ttmParams:
+        path = reverse("main:ttm")
+
+        yield (staticPathFor(path, urllib.urlencode(params)),
+               "main:ttm", params, ttmDigest)
+
+    choices = filterChoices(allEvents)
+    combos = list(filterCombos(allEvents, choices))
+
+    nonEmptyCombos = set(
+        frozenset(params.items()) for (params, events) in combos if events)
+
+    def neighboursDigest(filterParams):
+        """ Return digest of which filter combinations linked to from the
+        home sidebar have events, as that decides where the links point. """
+
+        hasEvents = []
+
+        for name, vals in choices:
+            for val in vals:
+                d = dict(filterParams)
+                d[name] = val
+
+                hasEvents.append(frozenset(
+                    (key, v) for (key, v) in d.items() if v is not None)
+                    in nonEmptyCombos)
+
+        return hashlib.sha1(repr(hasEvents)).hexdigest()
+
+    yield ("index.html", "main:home", {},
+           eventsDigest(allEvents) + sidebarDigest + neighboursDigest({}))
+
+    for filterParams, events in combos:
+        homeDigest = (eventsDigest(events) + sidebarDigest +
+                      neighboursDigest(filterParams))
+
+        for displayParams in productOf(displayChoices()):
+            params = dict(filterParams)
+            params.update(displayParams)
+
+            for p in [page("main:home", params, events, homeDigest),
+                      page("main:home", dict(params, csv = "1"), events,
+                           homeDigest)]:
+                if p:
+                    yield p
+
+        for drillParams in drillDowns(events):
+            params = dict(filterParams)
+            params.update(drillParams)
+
+            drilled = drillDown(events, drillParams)
+            digest = eventsDigest(drilled)
+
+            for p in [page("main:div-events", params, drilled, digest),
+                      page("main:div-events", dict(params, csv = "1"), drilled,
+                           digest)]:
+                if p:
+                    yield p
+
+def renderPage(job):
+    """ Render a single page into the output directory. Runs in a worker
+    process. """
+
+    outDir, relPath, path, params = job
+
+    resp = resolve(path).func(RequestFactory().get(path, params))
+    content = resp.content
+
+    if relPath.endswith(".html"):
+        content = rewriteLinks(content, _pagePaths)
+
+    writeFile(outDir, relPath, content)
+
+    return relPath
+
+def writeFile(outDir, relPath, content):
+    filename = os.path.join(outDir, relPath)
+
+    if not os.path.isdir(os.path.dirname(filename)):
+        os.makedirs(os.path.dirname(filename))
+
+    f = open(filename, "w")
+    f.write(content)
+    f.close()
+
+def loadManifest(outDir):
+    filename = os.path.join(outDir, MANIFEST_NAME)
+
+    if not os.path.isfile(filename):
+        return {}
+
+    f = open(filename, "r")
+    manifest = json.load(f)
+    f.close()
+
+    return manifest
+
+def saveManifest(outDir, manifest):
+    f = open(os.path.join(outDir, MANIFEST_NAME), "w")
+    json.dump(manifest, f, indent = 1, sort_keys = True)
+    f.close()
+
+def copyStaticFiles(outDir):
+    dest = os.path.join(outDir, settings.STATIC_URL.strip("/"))
+
+    for staticDir in settings.STATICFILES_DIRS:
+        for name in os.listdir(staticDir):
+            src = os.path.join(staticDir, name)
+
+            if os.path.isfile(src):
+                if not os.path.isdir(dest):
+                    os.makedirs(dest)
+
+                shutil.copy2(src, os.path.join(dest, name))
+
+class Command(BaseCommand):
+    help = ("Render every reachable view into a directory of static files "
+            "that can be served from the root of a plain file server. Only "
+            "pages whose dividend events changed since the last run are "
+            "re-rendered.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output", default = os.path.join(settings.BASE_DIR, "prerendered"),
+            help = "Output directory (default: %(default)s)")
+        parser.add_argument(
+            "--processes", type = int, default = None,
+            help = "Number of worker processes (default: number of CPUs)")
+        parser.add_argument(
+            "--force", action = "store_true", default = False,
+            help = "Re-render all pages, even unchanged ones")
+
+    def handle(self, *args, **options):
+        outDir = options["output"]
+
+        if not os.path.isdir(outDir):
+            os.makedirs(outDir)
+
+        oldManifest = loadManifest(outDir)
+        manifest = {}
+        jobs = []
+
+        # load the events once so that the forked workers all render from
+        # this copy instead of each page re-reading the data file
+        allEvents = divs.preloadDivEvents()
+
+        for relPath, urlName, params, digest in enumeratePages(allEvents):
+            manifest[relPath] = digest
+
+            if (options["force"] or (oldManifest.get(relPath) != digest) or
+                    not os.path.isfile(os.path.join(outDir, relPath))):
+                jobs.append((outDir, relPath, reverse(urlName), params))
+
+        global _pagePaths
+        _pagePaths = set(manifest)
+
+        emptyWritten = 0
+
+        for relPath, content in emptyPages().items():
+            manifest[relPath] = digest = hashlib.sha1(content).hexdigest()
+
+            if (options["force"] or (oldManifest.get(relPath) != digest) or
+                    not os.path.isfile(os.path.join(outDir, relPath))):
+                writeFile(outDir, relPath, content)
+                emptyWritten += 1
+
+        pool = multiprocessing.Pool(options["processes"])
+
+        try:
+            for i, relPath in enumerate(
+                    pool.imap_unordered(renderPage, jobs, chunksize = 32)):
+                if (options["verbosity"] > 1) or (((i + 1) % 1000) == 0):
+                    self.stdout.write("Rendered %d/%d: %s" % (
+                        i + 1, len(jobs), relPath))
+        finally:
+            pool.close()
+            pool.join()
+
+        removed = 0
+        for relPath in set(oldManifest) - set(manifest):
+            filename = os.path.join(outDir, relPath)
+
+            if os.path.isfile(filename):
+                os.remove(filename)
+                removed += 1
+
+        copyStaticFiles(outDir)
+        saveManifest(outDir, manifest)
+
+        self.stdout.write(
+            "%d pages, %d rendered, %d unchanged, %d removed" % (
+                len(manifest), len(jobs) + emptyWritten,
+                len(manifest) - len(jobs) - emptyWritten, removed))
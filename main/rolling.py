@@ -0,0 +1,103 @@
+import bisect
+import datetime
+from decimal import Decimal
+
+def yearBefore(date):
+    """ Return the same date one year earlier; February 29 maps to
+    February 28. """
+
+    try:
+        return date.replace(year = date.year - 1)
+    except ValueError:
+        return date.replace(year = date.year - 1, day = 28)
+
+def monthEnds(start, end):
+    """ Return list of last days of all months from start's month onwards
+    that are no later than end. """
+
+    ret = []
+    year, month = start.year, start.month
+
+    while True:
+        if month == 12:
+            nextMonth = datetime.date(year + 1, 1, 1)
+        else:
+            nextMonth = datetime.date(year, month + 1, 1)
+
+        monthEnd = nextMonth - datetime.timedelta(days = 1)
+
+        if monthEnd > end:
+            return ret
+
+        ret.append(monthEnd)
+        year, month = nextMonth.year, nextMonth.month
+
+def uniquePayments(events):
+    """ Return events, keeping only the first of each company's payments on
+    any given date. Every holding of a company gets the same per share
+    dividend, so it must only be counted once when summing those. """
+
+    seen = set()
+    ret = []
+
+    for ev in events:
+        key = (ev.company, ev.date)
+
+        if key not in seen:
+            seen.add(key)
+            ret.append(ev)
+
+    return ret
+
+class CumulativeSums(object):
+    """ Running totals of dividend amounts, kept separately for each value
+    of some attribute of the events (company, person, ...), so that the
+    total over any date range can be looked up with two binary searches
+    instead of a pass over the events. """
+
+    def __init__(self, events, keyFunc, amountFunc):
+        """ events must be sorted by date. keyFunc returns the key an event
+        is totalled under, amountFunc its amount. """
+
+        # key = keyFunc value, value = list of date ordinals of its events
+        self.ordinals = {}
+
+        # key = keyFunc value, value = list of cumulative sums, where the
+        # i'th item is the sum of amounts of the first i events; one longer
+        # than the ordinals list
+        self.sums = {}
+
+        for ev in events:
+            key = keyFunc(ev)
+
+            if key not in self.ordinals:
+                self.ordinals[key] = []
+                self.sums[key] = [Decimal(0)]
+
+            self.ordinals[key].append(ev.date.toordinal())
+            self.sums[key].append(self.sums[key][-1] + amountFunc(ev))
+
+    def keys(self):
+        return sorted(self.ordinals.keys())
+
+    def total(self, key, start, end):
+        """ Return sum of amounts of events under key whose date is after
+        start and no later than end. """
+
+        ordinals = self.ordinals.get(key)
+
+        if (not ordinals) or (end <= start):
+            return Decimal(0)
+
+        sums = self.sums[key]
+
+        i = bisect.bisect_right(ordinals, start.toordinal())
+        j = bisect.bisect_right(ordinals, end.toordinal())
+
+        return sums[j] - sums[i]
+
+    def trailingYear(self, key, end):
+        """ Return sum of amounts of events under key in the twelve months
+        up to and including end. """
+
+        return self.total(key, yearBefore(end), end)
@@ -1,3 +1,444 @@
+import datetime
+from decimal import Decimal
+import itertools
+import os
+import shutil
+import tempfile
+import urlparse
+
+from django.core.management.base import CommandError
 from django.test import TestCase
 
-# Create your tests here.
+import divs
+from management.commands import loadtest, prerender
+import rolling
+import views
+
+def makeEvent(date, company = "TSCO", person = "John", shares = 100,
+              amount = "10.00"):
+    return divs.DividendEvent(divs.Object(
+        date = date, person = person, broker = "IWeb", accountType = "Normal",
+        company = company, shares = str(shares), amount = amount,
+        isProjected = "0"))
+
+CSV_HEADER = "date,person,broker,accountType,company,shares,amount,isProjected\n"
+
+CSV_ROW = "1.6.2013,John,IWeb,Normal,TSCO,100,10.00,0\n"
+
+def d(year, month, day):
+    return datetime.date(year, month, day)
+
+class RollingTests(TestCase):
+    def setUp(self):
+        self.sums = rolling.CumulativeSums(
+            [makeEvent("1.3.2013", amount = "1.00"),
+             makeEvent("1.6.2013", amount = "2.00"),
+             makeEvent("1.6.2013", company = "BP", amount = "4.00"),
+             makeEvent("1.3.2014", amount = "8.00")],
+            lambda ev: ev.company, divs.nominalAmountFunc)
+
+    def testKeys(self):
+        self.assertEqual(self.sums.keys(), ["BP", "TSCO"])
+
+    def testTotalExcludesStartIncludesEnd(self):
+        self.assertEqual(self.sums.total("TSCO", d(2013, 3, 1), d(2013, 6, 1)),
+                         Decimal("2.00"))
+        self.assertEqual(self.sums.total("TSCO", d(2013, 2, 28), d(2013, 5, 31)),
+                         Decimal("1.00"))
+        self.assertEqual(self.sums.total("TSCO", d(2013, 1, 1), d(2014, 12, 31)),
+                         Decimal("11.00"))
+
+    def testTotalEmpty(self):
+        self.assertEqual(self.sums.total("TSCO", d(2013, 6, 1), d(2013, 6, 1)),
+                         Decimal(0))
+        self.assertEqual(self.sums.total("TSCO", d(2014, 1, 1), d(2013, 1, 1)),
+                         Decimal(0))
+        self.assertEqual(self.sums.total("NG", d(2013, 1, 1), d(2014, 1, 1)),
+                         Decimal(0))
+
+    def testTrailingYear(self):
+        # the payment exactly a year before end belongs to the previous year
+        self.assertEqual(self.sums.trailingYear("TSCO", d(2014, 3, 1)),
+                         Decimal("10.00"))
+        self.assertEqual(self.sums.trailingYear("TSCO", d(2014, 2, 28)),
+                         Decimal("3.00"))
+        self.assertEqual(self.sums.trailingYear("BP", d(2014, 6, 1)),
+                         Decimal(0))
+
+    def testYearBefore(self):
+        self.assertEqual(rolling.yearBefore(d(2014, 3, 1)), d(2013, 3, 1))
+        self.assertEqual(rolling.yearBefore(d(2016, 2, 29)), d(2015, 2, 28))
+
+    def testMonthEnds(self):
+        self.assertEqual(rolling.monthEnds(d(2015, 11, 15), d(2016, 2, 28)),
+                         [d(2015, 11, 30), d(2015, 12, 31), d(2016, 1, 31)])
+        self.assertEqual(rolling.monthEnds(d(2016, 2, 1), d(2016, 2, 29)),
+                         [d(2016, 2, 29)])
+        self.assertEqual(rolling.monthEnds(d(2016, 2, 1), d(2016, 2, 28)), [])
+
+class TaxYearTests(TestCase):
+    def testTaxYearMonthOf(self):
+        self.assertEqual(views.taxYearMonthOf(d(2014, 4, 5)),
+                         views.MONTH_APRIL_NEXT)
+        self.assertEqual(views.taxYearMonthOf(d(2014, 4, 1)),
+                         views.MONTH_APRIL_NEXT)
+        self.assertEqual(views.taxYearMonthOf(d(2014, 4, 6)), "April")
+        self.assertEqual(views.taxYearMonthOf(d(2014, 3, 31)), "March")
+        self.assertEqual(views.taxYearMonthOf(d(2014, 5, 1)), "May")
+
+    def testTaxYearOfDate(self):
+        self.assertEqual(views.taxYearOfDate(d(2014, 4, 5)), 2013)
+        self.assertEqual(views.taxYearOfDate(d(2014, 4, 6)), 2014)
+
+class ViewTestCase(TestCase):
+    """ Base class for view tests, serving self.events as the dividend
+    data. """
+
+    def setUp(self):
+        self.events = []
+        self.origGetDivEvents = divs.getDivEvents
+        divs.getDivEvents = lambda: self.events
+
+    def tearDown(self):
+        divs.getDivEvents = self.origGetDivEvents
+
+    def getCsv(self, url, **params):
+        params["csv"] = "1"
+        resp = self.client.get(url, params)
+        self.assertEqual(resp.status_code, 200)
+
+        return [line.split(",") for line in resp.content.splitlines()]
+
+class TtmViewTests(ViewTestCase):
+    def getCsv(self, **params):
+        return ViewTestCase.getCsv(self, "/ttm/", **params)
+
+    def testPerShareCountsEachPaymentOnce(self):
+        # two holders of the same company get paid the same dividend per
+        # share on the same dates
+        for date in ["1.6.2012", "1.6.2013"]:
+            self.events.append(makeEvent(date, person = "John", shares = 100))
+            self.events.append(makeEvent(date, person = "Holly", shares = 200,
+                                         amount = "20.00"))
+
+        rows = self.getCsv(end = "31.12.2013")
+        header, tsco = rows[0], rows[1]
+
+        self.assertEqual(tsco[0], "TSCO")
+        self.assertEqual(Decimal(tsco[header.index("TTM per share")]),
+                         Decimal("10.00"))
+        self.assertEqual(Decimal(tsco[header.index("Previous TTM per share")]),
+                         Decimal("10.00"))
+        self.assertEqual(Decimal(tsco[header.index("Per share growth %")]),
+                         Decimal("0"))
+
+    def testInvalidEndDate(self):
+        for end in ["bad", "31.2.2014", "1.1.1900", "01.01.0001",
+                    "1.1.9999", "31.12.9999"]:
+            resp = self.client.get("/ttm/", {"end": end})
+            self.assertEqual(resp.status_code, 400, end)
+
+    def testEndDateRangeLimits(self):
+        self.events = [makeEvent("1.6.1901")]
+
+        for end in ["1.1.1901", "31.12.9998"]:
+            self.assertEqual(
+                self.client.get("/ttm/", {"end": end}).status_code, 200)
+
+class PrerenderTests(TestCase):
+    def testStaticPathFor(self):
+        self.assertEqual(prerender.staticPathFor("/", ""), "index.html")
+        self.assertEqual(prerender.staticPathFor("/div-events/", ""),
+                         "div-events/index.html")
+
+        path = prerender.staticPathFor("/", "company=BP&bucketH=year")
+        self.assertTrue(path.startswith("home/"))
+        self.assertTrue(path.endswith(".html"))
+
+        # parameter order doesn't matter
+        self.assertEqual(
+            prerender.staticPathFor("/", "bucketH=year&company=BP"), path)
+        self.assertNotEqual(
+            prerender.staticPathFor("/", "bucketH=year&company=NG"), path)
+
+        self.assertTrue(prerender.staticPathFor(
+            "/div-events/", "csv=1&year=2013").endswith(".csv"))
+
+    def testEmptyPathFor(self):
+        self.assertEqual(prerender.emptyPathFor("/", "company=BP"),
+                         "home/empty.html")
+        self.assertEqual(
+            prerender.emptyPathFor("/", "csv=1&bucketH=taxYear&company=BP"),
+            "home/empty-taxYear.csv")
+        self.assertEqual(
+            prerender.emptyPathFor("/div-events/", "month=May&csv=1"),
+            "div-events/empty.csv")
+
+        # every path rewriteLinks may point to gets written
+        pages = prerender.emptyPages()
+
+        for path, query in [
+                ("/", "company=BP"),
+                ("/", "csv=1&bucketH=year"),
+                ("/", "csv=1&bucketH=taxYear"),
+                ("/div-events/", "month=May"),
+                ("/div-events/", "month=May&csv=1")]:
+            self.assertIn(prerender.emptyPathFor(path, query), pages)
+
+        self.assertIn(prerender.EMPTY_PAGE_TEXT, pages["home/empty.html"])
+        self.assertNotIn("<b>", pages["home/empty.html"])
+
+    def testRewriteLinks(self):
+        existing = prerender.staticPathFor("/", "company=BP")
+
+        html = ('<link href="/static/style.css">'
+                '<a href="/?company=BP">x</a>'
+                '<a href="/?company=NG">y</a>'
+                '<a href="/div-events/?year=2013&csv=1">z</a>'
+                '<a href="/">home</a>')
+
+        self.assertEqual(
+            prerender.rewriteLinks(html, set([existing, "index.html"])),
+            '<link href="/static/style.css">'
+            '<a href="/%s">x</a>'
+            '<a href="/home/empty.html">y</a>'
+            '<a href="/div-events/empty.csv">z</a>'
+            '<a href="/index.html">home</a>' % existing)
+
+    def testFilterCombos(self):
+        events = [makeEvent("1.1.2013", company = "BP", person = "John"),
+                  makeEvent("1.2.2013", company = "NG", person = "Holly")]
+
+        choices = [("company", [None, "BP", "NG"]),
+                   ("person", [None, "Holly", "John"])]
+
+        combos = dict(
+            (tuple(sorted(params.items())), [ev.company for ev in evs])
+            for (params, evs) in prerender.filterCombos(events, choices))
+
+        self.assertEqual(combos, {
+            (): ["BP", "NG"],
+            (("person", "Holly"),): ["NG"],
+            (("person", "John"),): ["BP"],
+            (("company", "BP"),): ["BP"],
+            (("company", "BP"), ("person", "Holly")): [],
+            (("company", "BP"), ("person", "John")): ["BP"],
+            (("company", "NG"),): ["NG"],
+            (("company", "NG"), ("person", "Holly")): ["NG"],
+            (("company", "NG"), ("person", "John")): [],
+            })
+
+    def testFilterCombosPrunesBelowEmpty(self):
+        events = [makeEvent("1.1.2013", company = "BP", person = "John")]
+
+        choices = [("company", [None, "BP", "NG"]),
+                   ("person", [None, "Holly", "John"])]
+
+        params = [p for (p, evs) in prerender.filterCombos(events, choices)]
+
+        # company=NG leaves nothing, so its person combinations are skipped
+        self.assertIn({"company": "NG"}, params)
+        self.assertNotIn({"company": "NG", "person": "John"}, params)
+
+class SnapshotTests(TestCase):
+    def setUp(self):
+        self.origHome = os.environ["HOME"]
+        self.home = tempfile.mkdtemp()
+        os.environ["HOME"] = self.home
+
+        os.makedirs(os.path.join(self.home, "info", "investing"))
+        self.filename = os.path.join(self.home, "info", "investing", "divs.csv")
+        self.writeCsv(CSV_HEADER + CSV_ROW)
+
+    def tearDown(self):
+        os.environ["HOME"] = self.origHome
+        shutil.rmtree(self.home)
+
+        divs._snapshot = None
+        divs._snapshotStat = None
+
+    def writeCsv(self, data):
+        f = open(self.filename, "w")
+        f.write(data)
+        f.close()
+
+    def testNotPreloaded(self):
+        self.assertIsNot(divs.getDivEvents(), divs.getDivEvents())
+
+    def testUnchangedFileKeepsSnapshot(self):
+        events = divs.preloadDivEvents()
+
+        self.assertEqual(len(events), 1)
+        self.assertIs(divs.getDivEvents(), events)
+        self.assertIs(divs.getDivEvents(), events)
+
+    def testSizeChangeReloads(self):
+        events = divs.preloadDivEvents()
+
+        st = os.stat(self.filename)
+        self.writeCsv(CSV_HEADER + CSV_ROW + CSV_ROW.replace("1.6.", "1.7."))
+        # make sure only the size gives the change away
+        os.utime(self.filename, (st.st_atime, st.st_mtime))
+
+        newEvents = divs.getDivEvents()
+        self.assertIsNot(newEvents, events)
+        self.assertEqual(len(newEvents), 2)
+        self.assertIs(divs.getDivEvents(), newEvents)
+
+    def testMtimeChangeReloads(self):
+        events = divs.preloadDivEvents()
+
+        # same size, different contents
+        self.writeCsv(CSV_HEADER + CSV_ROW.replace("10.00", "20.00"))
+        st = os.stat(self.filename)
+        os.utime(self.filename, (st.st_atime, st.st_mtime + 10))
+
+        newEvents = divs.getDivEvents()
+        self.assertIsNot(newEvents, events)
+        self.assertEqual(newEvents[0].amount, Decimal("20.00"))
+
+class UrlTemplateTests(TestCase):
+    KEYS = ["company", "person", "accountType", "bucketH", "perShare",
+            "cellContent"]
+
+    def paramSets(self):
+        """ Yield params dicts with all combinations of keys, with both
+        set and None values. """
+
+        for n in range(len(self.KEYS) + 1):
+            for keys in itertools.combinations(self.KEYS, n):
+                for vals in [["a b&c"] * n, [None, "x"] * n]:
+                    yield dict(zip(keys, vals))
+
+    def testDivEventsCells(self):
+        for params in self.paramSets():
+            self.assertEqual(
+                views.UrlTemplate("main:div-events", **params).url(),
+                views.url_for("main:div-events", **params))
+            self.assertEqual(
+                views.UrlTemplate(
+                    "main:div-events", year = views.FILL, **params).url(
+                        year = "2013"),
+                views.url_for("main:div-events", year = "2013", **params))
+            self.assertEqual(
+                views.UrlTemplate(
+                    "main:div-events", month = views.FILL, year = views.FILL,
+                    **params).url(month = "May", year = "2013"),
+                views.url_for(
+                    "main:div-events", month = "May", year = "2013", **params))
+
+    def testHomeSidebarLinks(self):
+        # the way home's makeLink builds its links
+        for params in self.paramSets():
+            for key in ["company", "isProjected", "csv"]:
+                for val in ["v w", None]:
+                    d = dict(params)
+                    d[key] = val
+
+                    tmplParams = dict(params)
+                    tmplParams[key] = views.FILL if val is not None else None
+
+                    self.assertEqual(
+                        views.UrlTemplate("main:home", **tmplParams).url(
+                            **{key: val}),
+                        views.url_for("main:home", **d))
+
+    def testAllNoneParams(self):
+        self.assertEqual(
+            views.UrlTemplate("main:home", company = None).url(),
+            views.url_for("main:home", company = None))
+
+class TaxYearViewTests(ViewTestCase):
+    def setUp(self):
+        ViewTestCase.setUp(self)
+
+        self.events = [
+            makeEvent("6.4.2013", amount = "1.00"),
+            makeEvent("30.4.2013", amount = "2.00"),
+            makeEvent("5.4.2014", amount = "4.00"),
+            makeEvent("6.4.2014", amount = "8.00"),
+            ]
+
+    def getDates(self, **params):
+        rows = self.getCsv("/div-events/", **params)
+
+        return [row[0] for row in rows[1:]]
+
+    def testTaxYearMonth(self):
+        self.assertEqual(
+            self.getDates(taxYearMonth = "April"),
+            ["2013-04-06", "2013-04-30", "2014-04-06"])
+        self.assertEqual(
+            self.getDates(taxYearMonth = views.MONTH_APRIL_NEXT),
+            ["2014-04-05"])
+
+    def testTaxYearAndTaxYearMonth(self):
+        self.assertEqual(
+            self.getDates(taxYear = "2013", taxYearMonth = "April"),
+            ["2013-04-06", "2013-04-30"])
+        self.assertEqual(
+            self.getDates(taxYear = "2013",
+                          taxYearMonth = views.MONTH_APRIL_NEXT),
+            ["2014-04-05"])
+        self.assertEqual(
+            self.getDates(taxYear = "2014", taxYearMonth = "April"),
+            ["2014-04-06"])
+
+    def testByTaxYearLinks(self):
+        req = self.client.get("/").wsgi_request
+        data, links = views.byTaxYear(
+            req, self.events, {"company": "TSCO"}, divs.nominalAmountFunc)
+
+        self.assertEqual(len(links), len(data))
+
+        for dataRow, linkRow in zip(data, links):
+            self.assertEqual(len(linkRow), len(dataRow))
+
+        self.assertEqual(data[0][1:], ["2013-2014", "2014-2015"])
+        self.assertEqual(
+            links[0][1],
+            views.url_for("main:div-events", taxYear = 2013, company = "TSCO"))
+
+        # last row before the footer is April (next)
+        self.assertEqual(data[-2][0], views.MONTH_APRIL_NEXT)
+        path, query = links[-2][1].split("?")
+        self.assertEqual(path, "/div-events/")
+        self.assertEqual(
+            sorted(urlparse.parse_qsl(query)),
+            [("company", "TSCO"), ("taxYear", "2013"),
+             ("taxYearMonth", views.MONTH_APRIL_NEXT)])
+
+        # the links lead to the events summed in the cells
+        self.assertEqual(data[-2][1], Decimal("4.00"))
+        resp = self.client.get("%s?%s&csv=1" % (path, query))
+        self.assertEqual(resp.content.splitlines()[1].split(",")[0],
+                         "2014-04-05")
+
+class LoadtestTests(TestCase):
+    def testParseMix(self):
+        self.assertEqual(loadtest.parseMix("home=3,div-events-csv=0"),
+                         [("home", 3), ("div-events-csv", 0)])
+        self.assertEqual(
+            [kind for (kind, weight) in loadtest.parseMix(loadtest.DEFAULT_MIX)],
+            ["home", "home-csv", "div-events", "div-events-csv"])
+
+    def testParseMixInvalid(self):
+        for mix in ["", "foo=1", "home", "home=", "home=x", "home=-1",
+                    "home=1,", "home=0,div-events=0"]:
+            self.assertRaises(CommandError, loadtest.parseMix, mix)
+
+    def testPercentile(self):
+        vals = range(1, 101)
+
+        self.assertEqual(loadtest.percentile(vals, 0), 1)
+        self.assertEqual(loadtest.percentile(vals, 50), 50)
+        self.assertEqual(loadtest.percentile(vals, 95), 95)
+        self.assertEqual(loadtest.percentile(vals, 99), 99)
+        self.assertEqual(loadtest.percentile(vals, 100), 100)
+
+        self.assertEqual(loadtest.percentile([1, 2, 3], 50), 2)
+        self.assertEqual(loadtest.percentile([1, 2, 3], 99), 3)
+
+    def testPercentileSingleValue(self):
+        for pct in [0, 50, 99, 100]:
+            self.assertEqual(loadtest.percentile([7], pct), 7)
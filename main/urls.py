@@ -7,4 +7,5 @@ app_name = "main"
 urlpatterns = [
     url(r"^$", views.home, name = "home"),
     url(r"^div-events/$", views.divEvents, name = "div-events"),
+    url(r"^ttm/$", views.ttm, name = "ttm"),
 ]
@@ -4,17 +4,20 @@ import datetime
 import urllib
 
 from django.contrib.staticfiles.templatetags.staticfiles import static
-from django.urls import reverse
-from django.http import HttpResponse
+from django.urls import get_script_prefix, reverse
+from django.http import HttpResponse, HttpResponseBadRequest
 from django.shortcuts import render
 
 import divs
+import rolling
 
 MONTHS = ["January", "February", "March", "April", "May", "June", "July",
           "August", "September", "October", "November", "December"]
 
 MONTH_APRIL_NEXT = "April (next)"
 
+TAX_YEAR_MONTHS = MONTHS[3:] + MONTHS[:3] + [MONTH_APRIL_NEXT]
+
 BUCKET_H_YEAR = "year"
 BUCKET_H_TAX_YEAR = "taxYear"
 
@@ -23,8 +26,39 @@ ACCOUNT_TYPE_ISA = "ISA"
 
 CELL_CONTENT_DETAILS = "details"
 
+TTM_DIMENSION_COMPANY = "company"
+TTM_DIMENSION_PERSON = "person"
+
+# same format as in the data file
+DATE_FORMAT = "%d.%m.%Y"
+
+# range of years allowed for the ttm view's end date: strftime can't format
+# dates before 1900, which the previous period's end would be for earlier
+# years, and the month ends after 9998 overflow datetime
+TTM_MIN_END_YEAR = 1901
+TTM_MAX_END_YEAR = 9998
+
+# the ttm view's cached cumulative sums are dropped once there are this many
+TTM_CACHE_SIZE = 1000
+
+# placeholder value for the query parameters of a UrlTemplate that are
+# filled in separately for each URL
+FILL = object()
+
+# key = (URL name, script prefix), value = reverse() result
+_reverseCache = {}
+
+def reverseCached(name):
+    key = (name, get_script_prefix())
+    url = _reverseCache.get(key)
+
+    if url is None:
+        url = _reverseCache[key] = reverse(name)
+
+    return url
+
 def url_for(name, **kwargs):
-    url = reverse(name)
+    url = reverseCached(name)
 
     if kwargs:
         d = dict(((key, val) for (key, val) in kwargs.iteritems() if val is not None))
@@ -32,6 +66,53 @@ def url_for(name, **kwargs):
 
     return url
 
+class UrlTemplate(object):
+    """ Builds URLs to one view that differ only in the values of some query
+    parameters, without resolving the route and encoding the other
+    parameters again for each URL.
+
+    Takes the same arguments as url_for, with FILL as the value of the
+    parameters that url() fills in. Parameters come out in the same order
+    as from url_for called the same way, so when the call sites match, so
+    do the generated URLs. """
+
+    def __init__(self, name, **kwargs):
+        self.base = reverseCached(name)
+        self.hasQuery = bool(kwargs)
+
+        # list of (key, "key=val" string); the latter is None for
+        # parameters filled in by url()
+        self.parts = []
+
+        d = dict(((key, val) for (key, val) in kwargs.iteritems() if val is not None))
+
+        for key, val in d.iteritems():
+            if val is FILL:
+                self.parts.append((key, None))
+            else:
+                self.parts.append((key, urllib.urlencode([(key, val)])))
+
+        # key = (key, val), value = "key=val" string
+        self.encoded = {}
+
+    def url(self, **vals):
+        if not self.hasQuery:
+            return self.base
+
+        s = []
+
+        for key, part in self.parts:
+            if part is None:
+                part = self.encoded.get((key, vals[key]))
+
+                if part is None:
+                    part = self.encoded[(key, vals[key])] = \
+                        urllib.urlencode([(key, vals[key])])
+
+            s.append(part)
+
+        return "%s?%s" % (self.base, "&".join(s))
+
 def taxYearOfDate(date):
     """ Return UK tax year of given date. Examples:
 
@@ -50,19 +131,40 @@ def taxYearOfDate(date):
         else:
             return date.year - 1
 
+def taxYearMonthOf(date):
+    """ Return the row of the tax year table given date falls in: its month
+    name, except for April 1-5, which end the tax year that began the
+    previous April and so are MONTH_APRIL_NEXT. """
+
+    # UK tax year begins on April 6
+    if not ((date.month == 4) and (date.day < 6)):
+        return MONTHS[date.month - 1]
+    else:
+        return MONTH_APRIL_NEXT
+
 def filterBy(events, attrName, attrVals):
     return [x for x in events if getattr(x, attrName) in attrVals]
 
-def applyRequestFilters(req, events):
+def requestFilterParams(req):
+    """ Return dict of the filters set in the request. """
+
     params = {}
 
     for name in ["company", "person", "broker", "accountType", "isProjected"]:
         val = req.GET.get(name)
 
         if val:
-            events = filterBy(events, name, [val])
             params[name] = val
 
+    return params
+
+def applyRequestFilters(req, events):
+    params = requestFilterParams(req)
+
+    for name in ["company", "person", "broker", "accountType", "isProjected"]:
+        if name in params:
+            events = filterBy(events, name, [params[name]])
+
     return (events, params)
 
 def groupBy(
@@ -121,15 +223,19 @@ def byYear(req, events, params, amountFunc):
     def vFunc(ev):
         return MONTHS[ev.date.month - 1]
 
+    yearLink = UrlTemplate("main:div-events", year = FILL, **params)
+    monthLink = UrlTemplate("main:div-events", month = FILL, **params)
+    cellLink = UrlTemplate("main:div-events", month = FILL, year = FILL, **params)
+
     links = []
     links.append(
         [url_for("main:div-events", **params)] +
-        [url_for("main:div-events", year = year, **params) for year in bucketsH])
+        [yearLink.url(year = year) for year in bucketsH])
 
     for month in bucketsV:
         links.append(
-            [url_for("main:div-events", month = month, **params)] +
-            [url_for("main:div-events", month = month, year = year, **params) for year in bucketsH])
+            [monthLink.url(month = month)] +
+            [cellLink.url(month = month, year = year) for year in bucketsH])
 
     # header and footer row have the same links
     links.append(links[0])
@@ -145,24 +251,40 @@ def byYear(req, events, params, amountFunc):
     return (data, links)
 
 def byTaxYear(req, events, params, amountFunc):
-    def hFunc(ev):
-        taxYear = taxYearOfDate(ev.date)
+    def taxYearName(taxYear):
         return "%d-%d" % (taxYear, taxYear + 1)
 
+    def hFunc(ev):
+        return taxYearName(taxYearOfDate(ev.date))
+
     # TODO: this breaks if we have a gap in yearly payments, like for BP;
     # should really iterate over years instead manually
-    bucketsH = sorted(list(set(hFunc(ev) for ev in events)))
+    taxYears = sorted(list(set(taxYearOfDate(ev.date) for ev in events)))
+    bucketsH = [taxYearName(taxYear) for taxYear in taxYears]
 
-    bucketsV = MONTHS[3:] + MONTHS[:3] + [MONTH_APRIL_NEXT]
+    bucketsV = TAX_YEAR_MONTHS
 
     def vFunc(ev):
-        # UK tax year begins on April 6
-        if not ((ev.date.month == 4) and (ev.date.day < 6)):
-            return MONTHS[ev.date.month - 1]
-        else:
-            return MONTH_APRIL_NEXT
+        return taxYearMonthOf(ev.date)
 
-    # TODO: create links
+    taxYearLink = UrlTemplate("main:div-events", taxYear = FILL, **params)
+    monthLink = UrlTemplate("main:div-events", taxYearMonth = FILL, **params)
+    cellLink = UrlTemplate(
+        "main:div-events", taxYearMonth = FILL, taxYear = FILL, **params)
+
+    links = []
+    links.append(
+        [url_for("main:div-events", **params)] +
+        [taxYearLink.url(taxYear = taxYear) for taxYear in taxYears])
+
+    for month in bucketsV:
+        links.append(
+            [monthLink.url(taxYearMonth = month)] +
+            [cellLink.url(taxYearMonth = month, taxYear = taxYear)
+             for taxYear in taxYears])
+
+    # header and footer row have the same links
+    links.append(links[0])
 
     data = groupBy(
         req, events,
@@ -172,7 +294,7 @@ def byTaxYear(req, events, params, amountFunc):
         "Month",
         )
 
-    return (data, None)
+    return (data, links)
 
 def renderCsv(data):
     """ Format data (a list of lists (first list: column names, second:
@@ -293,15 +415,26 @@ def home(req):
     params["perShare"] = perShare
     params["cellContent"] = req.GET.get("cellContent")
 
+    # key = (params key, whether the value is None), value = UrlTemplate
+    # for links changing that key
+    linkTemplates = {}
+
     def makeLink(key, val, text):
         if params.get(key) == val:
             return "%s%s<b>%s</b>" % (indent, indent, text)
         else:
-            d = dict(params)
-            d[key] = val
-            return "%s%s%s" % (indent, indent, formatLink(url_for("main:home", **d), text))
+            tmplKey = (key, val is None)
+            tmpl = linkTemplates.get(tmplKey)
+
+            if tmpl is None:
+                d = dict(params)
+                d[key] = FILL if val is not None else None
+                tmpl = linkTemplates[tmplKey] = UrlTemplate("main:home", **d)
+
+            return "%s%s%s" % (indent, indent, formatLink(tmpl.url(**{key: val}), text))
 
     links.append("<a href=\"%s\">Home</a>" % url_for("main:home"))
+    links.append("<a href=\"%s\">Trailing 12 months</a>" % url_for("main:ttm"))
 
     links.append("")
     links.append("Grouping")
@@ -396,9 +529,9 @@ def divEvents(req):
     if month:
         events = [ev for ev in events if MONTHS[ev.date.month - 1] == month]
 
-    if req.GET.get("taxYearMonth"):
-        # TODO: impl; treats "April" >= day6, "April (next)" < day 6
-        raise Exception("taxYearMonth not implemented yet!")
+    taxYearMonth = req.GET.get("taxYearMonth")
+    if taxYearMonth:
+        events = [ev for ev in events if taxYearMonthOf(ev.date) == taxYearMonth]
 
     res = [divs.DividendEvent.header()]
     res.extend([ev.asList() for ev in events])
@@ -430,3 +563,168 @@ def divEvents(req):
     main = "<div id=main>\n%s\n%s\n%s\n\n</div>" % (filtersStr, tbl, csvLink)
 
     return HttpResponse("\n\n".join([getHTMLHeader(), sidebar, main, getHTMLFooter()]))
+
+def growthPercent(now, before):
+    """ Return growth from before to now in percent, or an empty string if
+    there's nothing to compare against. """
+
+    if not before:
+        return ""
+
+    return ((now / before - 1) * 100).quantize(Decimal("0.01"))
+
+# (events list, dict) where key = (filter params, dimension) and value = the
+# ttmSums() result for them. The dict is replaced when divs loads a new
+# snapshot of the events.
+_ttmCache = (None, {})
+
+def ttmSums(req, allEvents, params, dimension):
+    """ Return (nominal, per share, total, date of first event) for the ttm
+    view, where the first three are rolling.CumulativeSums of the events
+    matching the request's filters. They're cached for as long as
+    getDivEvents keeps returning the same snapshot, so that with a
+    preloaded snapshot repeated queries don't need to go through all the
+    events again. """
+
+    global _ttmCache
+
+    cachedEvents, cache = _ttmCache
+
+    if (cachedEvents is not allEvents) or (len(cache) >= TTM_CACHE_SIZE):
+        cache = {}
+        _ttmCache = (allEvents, cache)
+
+    cacheKey = (frozenset(params.items()), dimension)
+    sums = cache.get(cacheKey)
+
+    if sums is not None:
+        return sums
+
+    events = applyRequestFilters(req, allEvents)[0]
+
+    def keyFunc(ev):
+        return getattr(ev, dimension)
+
+    def totalKeyFunc(ev):
+        return None
+
+    nominal = rolling.CumulativeSums(events, keyFunc, divs.nominalAmountFunc)
+    totals = rolling.CumulativeSums(events, totalKeyFunc, divs.nominalAmountFunc)
+
+    # per share amounts only make sense summed within a single company
+    perShare = None
+    if dimension == TTM_DIMENSION_COMPANY:
+        perShare = rolling.CumulativeSums(
+            rolling.uniquePayments(events), keyFunc, divs.perShareAmountFunc)
+
+    firstDate = events[0].date if events else None
+
+    sums = cache[cacheKey] = (nominal, perShare, totals, firstDate)
+
+    return sums
+
+def ttm(req):
+    """ Trailing twelve month dividend totals and their growth over the
+    previous twelve months, by company or person. """
+
+    allEvents = divs.getDivEvents()
+    params = requestFilterParams(req)
+
+    endStr = req.GET.get("end")
+    if endStr:
+        try:
+            end = datetime.datetime.strptime(endStr, DATE_FORMAT).date()
+        except ValueError:
+            end = None
+
+        if (end is None) or not (
+                TTM_MIN_END_YEAR <= end.year <= TTM_MAX_END_YEAR):
+            return HttpResponseBadRequest(
+                "Invalid end date '%s', expected dd.mm.yyyy with a year "
+                "between %d and %d" % (
+                    endStr, TTM_MIN_END_YEAR, TTM_MAX_END_YEAR),
+                content_type = "text/plain")
+    else:
+        end = datetime.date.today()
+
+    prevEnd = rolling.yearBefore(end)
+
+    dimension = req.GET.get("dimension", TTM_DIMENSION_COMPANY)
+
+    if dimension not in (TTM_DIMENSION_COMPANY, TTM_DIMENSION_PERSON):
+        raise Exception("Unknown dimension: %s" % dimension)
+
+    nominal, perShare, totals, firstDate = ttmSums(
+        req, allEvents, params, dimension)
+
+    res = [[dimension, "TTM", "Previous TTM", "Growth %"]]
+
+    if perShare:
+        res[0].extend(["TTM per share", "Previous TTM per share",
+                       "Per share growth %"])
+
+    for key in nominal.keys():
+        now = nominal.trailingYear(key, end)
+        before = nominal.trailingYear(key, prevEnd)
+
+        row = [key, now, before, growthPercent(now, before)]
+
+        if perShare:
+            now = perShare.trailingYear(key, end)
+            before = perShare.trailingYear(key, prevEnd)
+
+            row.extend([now, before, growthPercent(now, before)])
+
+        res.append(row)
+
+    now = totals.trailingYear(None, end)
+    before = totals.trailingYear(None, prevEnd)
+
+    res.append(["Total", now, before, growthPercent(now, before)] +
+               [""] * (len(res[0]) - 4))
+
+    if req.GET.get("csv") == "1":
+        return renderCsv(res)
+
+    history = [["Month end", "TTM", "Growth %"]]
+
+    if firstDate:
+        for monthEnd in rolling.monthEnds(firstDate, end):
+            now = totals.trailingYear(None, monthEnd)
+            before = totals.trailingYear(None, rolling.yearBefore(monthEnd))
+
+            history.append(
+                [monthEnd.strftime(DATE_FORMAT), now, growthPercent(now, before)])
+
+    links = []
+    indent = "&nbsp;&nbsp;"
+
+    def makeLink(key, val, text):
+        d = dict(params)
+        d["dimension"] = dimension
+        d["end"] = endStr
+
+        if d.get(key) == val:
+            return "%s%s<b>%s</b>" % (indent, indent, text)
+        else:
+            d[key] = val
+            return "%s%s%s" % (indent, indent, formatLink(url_for("main:ttm", **d), text))
+
+    links.append("<a href=\"%s\">Home</a>" % url_for("main:home"))
+
+    links.append("")
+    links.append("Grouping")
+    links.append(makeLink("dimension", TTM_DIMENSION_COMPANY, "Company"))
+    links.append(makeLink("dimension", TTM_DIMENSION_PERSON, "Person"))
+
+    title = "<p>Twelve months to %s, compared to twelve months to %s</p>" % (
+        end.strftime(DATE_FORMAT), prevEnd.strftime(DATE_FORMAT))
+
+    sidebar = "<div id=sidebar>\n%s\n</div>" % "\n<br>".join(links)
+    main = "<div id=main>\n%s\n%s\n%s\n<p>\n%s\n</div>" % (
+        title,
+        renderTable(res),
+        makeLink("csv", "1", "<img src=\"%s\">" % static("excel.jpg")),
+        renderTable(history))
+
+    return HttpResponse("\n\n".join([getHTMLHeader(), sidebar, main, getHTMLFooter()]))